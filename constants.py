@@ -10,6 +10,10 @@ class WorkerInstruction(Enum):
     SET = 4
     EXPLORE = 5
     GET_PROFILING_INFO = 6
+    SYNC = 7
+
+# Tag of the values a worker pushes to the master right after TRAIN.
+TRAIN_RESULT_TAG = 1
 
 def get_hp_range_definition():
     range_def_dict = {
@@ -5,18 +5,28 @@ The common entry point of all nodes.
 from __future__ import print_function
 
 from mpi4py import MPI
+import importlib
+import logging
 import os
 import subprocess
 
 from pbt_cluster import PBTCluster
 from training_worker import TrainingWorker
 
-from cifar10_model import Cifar10Model
-from toy_model import ToyModel
-from mnist_model import MNISTModel
 import sys
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+# Per-graph messages of the PBT rounds are only printed with PBT_DEBUG=1,
+# so stdout is kept off the critical path of every round. Only the project
+# loggers are configured: the root logger stays at WARNING, which keeps the
+# INFO output of TensorFlow, matplotlib and hyperopt quiet.
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(logging.Formatter('%(message)s'))
+for logger_name in ('pbt_cluster', 'training_worker'):
+    project_logger = logging.getLogger(logger_name)
+    project_logger.addHandler(log_handler)
+    project_logger.setLevel(logging.DEBUG if os.environ.get('PBT_DEBUG') == '1' else logging.INFO)
+    project_logger.propagate = False
 ##################
 # configurations
 ##################
@@ -25,7 +35,7 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 # train_round = 30
 # population_size = 2
 # epochs_per_round = 4
-# target_model = ToyModel
+# target_model = ('toy_model', 'ToyModel')
 # do_exploit = True
 # do_explore = True
 
@@ -39,9 +49,11 @@ do_explore = True
 if len(sys.argv) >= 2:
     population_size = int(sys.argv[1])
 
-#target_model = ToyModel
-target_model = MNISTModel
-#target_model = Cifar10Model
+# (module, class) of the model. Only the workers import it, so the master
+# does not load TensorFlow just to coordinate the population.
+#target_model = ('toy_model', 'ToyModel')
+target_model = ('mnist_model', 'MNISTModel')
+#target_model = ('cifar10_model', 'Cifar10Model')
 
 comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
@@ -60,7 +72,7 @@ if rank == master_rank:
     with open('test_results.txt', 'a') as result_file:
         result_file.write('n = {}, pop_size = {}, time = {}s\n'.format(comm.Get_size(), population_size, elapsed_time))
 
-    if target_model == ToyModel:
+    if target_model[1] == 'ToyModel':
         cluster.report_plot_for_toy_model()
     cluster.report_accuracy_plot()
     cluster.report_lr_plot()
@@ -69,5 +81,6 @@ if rank == master_rank:
     cluster.print_profiling_info()
     cluster.kill_all_workers()
 else:
-    worker = TrainingWorker(comm, master_rank, target_model_class=target_model)
+    target_model_class = getattr(importlib.import_module(target_model[0]), target_model[1])
+    worker = TrainingWorker(comm, master_rank, target_model_class=target_model_class)
     worker.main_loop()
@@ -125,8 +125,13 @@ def cnn_model_fn(features, labels, mode, params):
     return tf.estimator.EstimatorSpec(
         mode=mode, loss=loss, eval_metric_ops=eval_metric_ops)
 
-def main(hp, model_id, save_base_dir, data_dir, train_epochs, epoch_index):
-    save_dir = save_base_dir + str(model_id)
+_mnist_data_cache = {}
+
+def load_mnist_data(data_dir):
+    # All the graphs of a worker train on the same data set, so decode the
+    # gzip files once per process instead of once per graph per round.
+    if data_dir in _mnist_data_cache:
+        return _mnist_data_cache[data_dir]
 
     with gzip.open(os.path.join(data_dir, 'train-images-idx3-ubyte.gz'), 'rb') as file:
         train_data = np.frombuffer(file.read(), np.uint8, offset=16).astype(np.float32).reshape(-1,28*28)
@@ -137,6 +142,14 @@ def main(hp, model_id, save_base_dir, data_dir, train_epochs, epoch_index):
     with gzip.open(os.path.join(data_dir, 't10k-labels-idx1-ubyte.gz'), 'rb') as file:
         eval_labels = np.frombuffer(file.read(), np.uint8, offset=8).astype(np.int32)
 
+    _mnist_data_cache[data_dir] = (train_data, train_labels, eval_data, eval_labels)
+    return _mnist_data_cache[data_dir]
+
+def main(hp, model_id, save_base_dir, data_dir, train_epochs, epoch_index):
+    save_dir = save_base_dir + str(model_id)
+
+    train_data, train_labels, eval_data, eval_labels = load_mnist_data(data_dir)
+
     session_config = tf.ConfigProto(allow_soft_placement=True)
     session_config.gpu_options.allow_growth = True
 
@@ -6,24 +6,25 @@ The PBTCluster should only be run on the master node.
 from __future__ import print_function
 
 import math
-import shutil
-import subprocess
 import os
 import csv
 import json
 import time
 import datetime
+import logging
 
 from constants import generate_random_hparam
 import matplotlib
 matplotlib.use('Agg')  # Force matplotlib to not use any Xwindows backend.
 from matplotlib import pyplot
 import numpy as np
-import six
+from mpi4py import MPI
 
-from constants import WorkerInstruction
+from constants import WorkerInstruction, TRAIN_RESULT_TAG
 from constants import get_hp_range_definition, load_hp_space
 
+logger = logging.getLogger(__name__)
+
 class PBTCluster:
     def __init__(self, pop_size, comm, master_rank, epochs_per_round, do_exploit=True, do_explore=True):
         self.pop_size = pop_size
@@ -34,6 +35,8 @@ class PBTCluster:
         self.do_explore = do_explore        
 
         self.exploit_time = 0
+        # Every instruction starts with its opcode broadcast from this buffer
+        self.opcode = np.zeros(1, dtype=np.int32)
 
         self.dispatch_hparams_to_workers()
 
@@ -53,36 +56,53 @@ class PBTCluster:
             self.pop_size = len(all_hparams_need_training)'''
 
         print('Population size = {}'.format(len(all_hparams_need_training)))
-        graphs_per_worker = math.ceil(float(self.pop_size) / float((self.comm.Get_size() - 1)))
-        graphs_to_make = len(all_hparams_need_training)
+        # Split the population as evenly as possible: the first `remainder`
+        # workers take one extra graph.
+        num_workers = self.comm.Get_size() - 1
+        graphs_per_worker, remainder = divmod(self.pop_size, num_workers)
 
         if self.do_explore and not self.do_exploit:
             is_explore_only = True
         else:
             is_explore_only = False
 
-        reqs = []
+        # The rank owning each graph, indexed by cluster id
+        self.graph_ranks = np.empty(self.pop_size, dtype=np.int32)
+        graphs_for_ranks = [None] * self.comm.Get_size()
         num_workers_sent = 0
+        end = 0
         for i in range(0, self.comm.Get_size()):
             if i != self.master_rank:
-                begin = num_workers_sent * graphs_per_worker
-                end = min(graphs_per_worker, graphs_to_make) + begin
+                begin = end
+                end = begin + graphs_per_worker + (1 if num_workers_sent < remainder else 0)
                 hparams_for_the_worker = all_hparams_need_training[begin: end]
-                reqs.append(self.comm.isend((WorkerInstruction.ADD_GRAPHS,
-                                             hparams_for_the_worker, 
-                                             begin, is_explore_only), dest=i))
-                graphs_to_make -= graphs_per_worker
+                graphs_for_ranks[i] = (hparams_for_the_worker, begin)
+                self.graph_ranks[begin: end] = i
                 num_workers_sent += 1
-        for req in reqs:
-            req.wait()
+
+        self.broadcast_instruction(WorkerInstruction.ADD_GRAPHS, is_explore_only)
+        self.scatter_to_workers(graphs_for_ranks)
+
+    def broadcast_instruction(self, inst, *args):
+        # Every worker runs the same instruction stream, so one collective
+        # replaces the per-worker isend fan-out. The opcode goes out as a raw
+        # int32 buffer; only instructions with arguments pickle anything.
+        self.opcode[0] = inst.value
+        self.comm.Bcast(self.opcode, root=self.master_rank)
+        if args:
+            self.comm.bcast(args, root=self.master_rank)
+
+    def scatter_to_workers(self, data_for_ranks):
+        # data_for_ranks is indexed by rank; the master's own slot is ignored.
+        self.comm.scatter(data_for_ranks, root=self.master_rank)
+
+    def gather_from_workers(self):
+        # Returns [(worker_rank, data), ...] for every worker.
+        all_data = self.comm.gather(None, root=self.master_rank)
+        return [(i, data) for i, data in enumerate(all_data) if i != self.master_rank]
 
     def kill_all_workers(self):
-        reqs = []
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                reqs.append(self.comm.isend((WorkerInstruction.EXIT,), dest=i))
-        for req in reqs:
-            req.wait()
+        self.broadcast_instruction(WorkerInstruction.EXIT)
 
     def train(self, round_num):
         start_time = time.time()
@@ -90,12 +110,10 @@ class PBTCluster:
             round_start_time = time.time()
             print('\nRound {}'.format(round))
 
-            reqs = []
-            for i in range(0, self.comm.Get_size()):
-                if i != self.master_rank:
-                    reqs.append(self.comm.isend((WorkerInstruction.TRAIN, self.epochs_per_round, self.epochs_per_round*round_num), dest=i))
-            for req in reqs:
-                req.wait()
+            # With exploit enabled the workers push their values right after
+            # training, which saves a separate GET round.
+            self.broadcast_instruction(WorkerInstruction.TRAIN, self.epochs_per_round,
+                                       self.epochs_per_round*round_num, self.do_exploit)
 
             if self.do_exploit:
                 self.exploit()
@@ -111,117 +129,72 @@ class PBTCluster:
         return end_time - start_time
 
     def exploit(self):
-        reqs = []
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                reqs.append(self.comm.isend((WorkerInstruction.GET,), dest=i))
-        for req in reqs:
-            req.wait()
-
+        # Consume the post-TRAIN replies in completion order, so the results
+        # of fast workers are merged while the stragglers are still training.
         all_values = []
-        cluster_id_to_worker_rank = {}
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                data = self.comm.recv(source=i)
-                all_values += data
-                for d in data:
-                    cluster_id_to_worker_rank[d[0]] = i
+        for _ in range(self.comm.Get_size() - 1):
+            all_values += self.comm.recv(source=MPI.ANY_SOURCE, tag=TRAIN_RESULT_TAG)
 
         exploit_begin_time = time.time()
         # copy top 25% to bottom 25%
-        all_values = sorted(all_values, key=lambda value: value[1])
         self.pop_size = len(all_values)
-        '''print 'The ranking before exploit'
-        for i in all_values:
-            print 'graph {}, loss={}'.format(i[0], i[1])'''
+        accuracies = np.fromiter((value[1] for value in all_values), dtype=np.float64, count=self.pop_size)
         num_graphs_to_copy = math.ceil(self.pop_size / 4.0)
+        # Only the bottom and top quarters are needed, so partition the
+        # accuracies around them instead of sorting the whole population.
+        if num_graphs_to_copy > 0:
+            bottom_indices = np.argpartition(accuracies, num_graphs_to_copy - 1)[:num_graphs_to_copy]
+            top_indices = np.argpartition(accuracies, self.pop_size - num_graphs_to_copy)[self.pop_size - num_graphs_to_copy:]
+        else:
+            bottom_indices = top_indices = []
         graphs_need_updating = []
-        for i in range(num_graphs_to_copy):
-            bottom_index = i
-            top_index = len(all_values) - num_graphs_to_copy + i
+        for bottom_index, top_index in zip(bottom_indices, top_indices):
             all_values[bottom_index][1] = all_values[top_index][1]  # copy accuracy, not necessary
             all_values[bottom_index][2] = all_values[top_index][2]  # copy hparams
 
-            source_dir = './savedata/model_' + str(all_values[top_index][0])
-            destination_dir = './savedata/model_' + str(all_values[bottom_index][0])
-            self.copyfiles(source_dir, destination_dir)
-
-            graphs_need_updating.append(bottom_index)
-            print('Copied: {} -> {}'.format(all_values[top_index][0], all_values[bottom_index][0]))
+            graphs_need_updating.append((all_values[top_index][0], all_values[bottom_index]))
 
-        # only update the bottom graphs
-        worker_rank_to_graphs_need_updating = {}
-        for i in range(self.comm.Get_size()):
-            worker_rank_to_graphs_need_updating[i] = []
-        for i in graphs_need_updating:
-            worker_rank = cluster_id_to_worker_rank[all_values[i][0]]
-            worker_rank_to_graphs_need_updating[worker_rank].append(all_values[i])
+        # Only the worker that owns a bottom graph is told about it. That
+        # worker copies the checkpoint of the top graph itself, so the copies
+        # run in parallel on the workers instead of one by one on the master.
+        worker_rank_to_graphs_need_updating = [[] for _ in range(self.comm.Get_size())]
+        bottom_ids = np.fromiter((values[0] for _, values in graphs_need_updating),
+                                 dtype=np.int64, count=len(graphs_need_updating))
+        for worker_rank, graph in zip(self.graph_ranks[bottom_ids], graphs_need_updating):
+            worker_rank_to_graphs_need_updating[worker_rank].append(graph)
 
-        reqs = []
-        for worker_rank, values in six.iteritems(worker_rank_to_graphs_need_updating):
-            reqs.append(self.comm.isend((WorkerInstruction.SET, values), dest=worker_rank))
-        for req in reqs:
-            req.wait()
+        self.broadcast_instruction(WorkerInstruction.SET)
+        self.scatter_to_workers(worker_rank_to_graphs_need_updating)
+        # Matches the barrier the workers enter once their copies are done
+        self.comm.Barrier()
 
         self.exploit_time += time.time() - exploit_begin_time
 
-    def copyfiles(self, src_dir, dest_dir):
-        if src_dir == dest_dir:
-            print('Warning, src_dir and dest_dir are the same')
-            return
-        for i in os.listdir(dest_dir):
-            path = os.path.join(dest_dir, i)
-            if not os.path.isdir(path) and i != 'learning_curve.csv' and i != 'theta.csv' and not i.startswith('events.out') and not i.startswith('.nfs'):
-                #print('Removing: {}'.format(path))
-                subprocess.call(['rm', '-f', path])
-        for i in os.listdir(src_dir):
-            path = os.path.join(src_dir, i)
-            if not os.path.isdir(path)  and i != 'theta.csv' and i != 'learning_curve.csv' and not i.startswith('events.out') and not i.startswith('.nfs'):
-                #print('Copying: {}'.format(path))
-                subprocess.call(['cp', path, dest_dir])
-
     def explore(self):
-        reqs = []
-        for i in range(self.comm.Get_size()):
-            if i != self.master_rank:
-                reqs.append(self.comm.isend((WorkerInstruction.EXPLORE,), dest=i))
-        for req in reqs:
-            req.wait()
+        self.broadcast_instruction(WorkerInstruction.EXPLORE)
 
     def flush_all_instructions(self):
-        # GET will block until all workers finish their instruction queues
-        self.get_all_values()
+        # SYNC will block until all workers finish their instruction queues.
+        # Only the number of live graphs comes back, instead of all the values.
+        self.broadcast_instruction(WorkerInstruction.SYNC)
+        self.pop_size = self.comm.reduce(0, op=MPI.SUM, root=self.master_rank)
 
     def get_all_values(self):
-        reqs = []
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                reqs.append(self.comm.isend((WorkerInstruction.GET,), dest=i))
-        for req in reqs:
-            req.wait()
+        self.broadcast_instruction(WorkerInstruction.GET)
 
         all_values = []
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                data = self.comm.recv(source=i)
-                all_values += data
+        for _, data in self.gather_from_workers():
+            all_values += data
         return all_values
 
     def print_profiling_info(self):
-        reqs = []
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                print('Requesting profiling info for worker {}'.format(i))
-                reqs.append(self.comm.isend((WorkerInstruction.GET_PROFILING_INFO,), dest=i))
-        for req in reqs:
-            req.wait()
+        print('Requesting profiling info from workers')
+        self.broadcast_instruction(WorkerInstruction.GET_PROFILING_INFO)
 
         all_infos = []
-        for i in range(0, self.comm.Get_size()):
-            if i != self.master_rank:
-                print('Recv from worker {}'.format(i))
-                data = self.comm.recv(source=i)
-                all_infos.append(data)
+        for i, data in self.gather_from_workers():
+            logger.debug('Recv from worker %d', i)
+            all_infos.append(data)
 
         total_train_time = 0
         total_explore_time = 0
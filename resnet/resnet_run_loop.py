@@ -380,9 +380,11 @@ def resnet_main(
   # intra_op_parallelism_threads. Note that we default to having
   # allow_soft_placement = True, which is required for multi-GPU and not
   # harmful for other modes.
-  gpu_memory_fraction = tf.GPUOptions(per_process_gpu_memory_fraction=0.4) # Xinyi add
+  # Grow GPU memory on demand instead of reserving a fixed fraction, so the
+  # number of graphs a worker can hold is not capped by a guessed fraction.
+  gpu_options = tf.GPUOptions(allow_growth=True) # Xinyi add
   session_config = tf.ConfigProto(
-      gpu_options=gpu_memory_fraction, # Xinyi add
+      gpu_options=gpu_options, # Xinyi add
       inter_op_parallelism_threads=flags_obj.inter_op_parallelism_threads,
       intra_op_parallelism_threads=flags_obj.intra_op_parallelism_threads,
       allow_soft_placement=True)
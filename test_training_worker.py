@@ -0,0 +1,109 @@
+from __future__ import print_function
+
+from mpi4py import MPI
+from training_worker import TrainingWorker
+
+import unittest
+import os
+import shutil
+import tempfile
+
+class CopyFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.base_dir, 'model_0')
+        self.dest_dir = os.path.join(self.base_dir, 'model_1')
+        os.mkdir(self.src_dir)
+        os.mkdir(self.dest_dir)
+        self.worker = TrainingWorker(MPI.COMM_SELF, 0, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def make_files(self, dir, names):
+        for name in names:
+            with open(os.path.join(dir, name), 'w') as f:
+                f.write(name)
+
+    def write_state(self, dir, latest, all_paths):
+        with open(os.path.join(dir, 'checkpoint'), 'w') as f:
+            f.write('model_checkpoint_path: "{}"\n'.format(latest))
+            for path in all_paths:
+                f.write('all_model_checkpoint_paths: "{}"\n'.format(path))
+
+    def ckpt_files(self, prefix):
+        return [prefix + '.index', prefix + '.data-00000-of-00001', prefix + '.meta']
+
+    def test_latest_of_retained_checkpoints(self):
+        for step in [10, 100, 1000]:
+            self.make_files(self.src_dir, self.ckpt_files('model.ckpt-{}'.format(step)))
+        self.make_files(self.src_dir, ['graph.pbtxt', 'learning_curve.csv', 'events.out.tfevents.1'])
+        self.write_state(self.src_dir, 'model.ckpt-100',
+                         ['model.ckpt-10', 'model.ckpt-100', 'model.ckpt-1000'])
+        self.make_files(self.dest_dir, self.ckpt_files('model.ckpt-5') + ['learning_curve.csv'])
+
+        self.assertEqual(self.worker.latest_checkpoint_name(self.src_dir), 'model.ckpt-100')
+        self.worker.copyfiles(self.src_dir, self.dest_dir)
+
+        self.assertEqual(sorted(os.listdir(self.dest_dir)),
+                         sorted(['checkpoint', 'graph.pbtxt', 'learning_curve.csv']
+                                + self.ckpt_files('model.ckpt-100')))
+        self.assertEqual(self.worker.latest_checkpoint_name(self.dest_dir), 'model.ckpt-100')
+        # The destination keeps its own learning curve
+        with open(os.path.join(self.dest_dir, 'learning_curve.csv')) as f:
+            self.assertEqual(f.read(), 'learning_curve.csv')
+
+    def test_absolute_checkpoint_path(self):
+        self.make_files(self.src_dir, self.ckpt_files('model.ckpt-10') + self.ckpt_files('model.ckpt-20'))
+        self.write_state(self.src_dir, os.path.join(self.src_dir, 'model.ckpt-20'),
+                         [os.path.join(self.src_dir, 'model.ckpt-10'),
+                          os.path.join(self.src_dir, 'model.ckpt-20')])
+
+        self.assertEqual(self.worker.latest_checkpoint_name(self.src_dir), 'model.ckpt-20')
+        self.worker.copyfiles(self.src_dir, self.dest_dir)
+
+        self.assertEqual(sorted(os.listdir(self.dest_dir)),
+                         sorted(['checkpoint'] + self.ckpt_files('model.ckpt-20')))
+        # The destination state points at its own copy, not at the source
+        self.assertEqual(self.worker.latest_checkpoint_name(self.dest_dir), 'model.ckpt-20')
+        with open(os.path.join(self.dest_dir, 'checkpoint')) as f:
+            self.assertNotIn(self.src_dir, f.read())
+
+    def test_no_state_file(self):
+        files = self.ckpt_files('model.ckpt-10') + self.ckpt_files('model.ckpt-20') + ['graph.pbtxt']
+        self.make_files(self.src_dir, files)
+
+        self.assertIsNone(self.worker.latest_checkpoint_name(self.src_dir))
+        self.worker.copyfiles(self.src_dir, self.dest_dir)
+
+        self.assertEqual(sorted(os.listdir(self.dest_dir)), sorted(files))
+
+    def test_toy_model_checkpoint(self):
+        self.make_files(self.src_dir, self.ckpt_files('model.ckpt') + ['theta.csv'])
+        self.write_state(self.src_dir, 'savedata/model_0/model.ckpt', ['savedata/model_0/model.ckpt'])
+
+        self.assertEqual(self.worker.latest_checkpoint_name(self.src_dir), 'model.ckpt')
+        self.worker.copyfiles(self.src_dir, self.dest_dir)
+
+        self.assertEqual(sorted(os.listdir(self.dest_dir)),
+                         sorted(['checkpoint'] + self.ckpt_files('model.ckpt')))
+
+    def test_incomplete_copy_has_no_state_file(self):
+        self.make_files(self.src_dir, ['model.ckpt-10.index', 'model.ckpt-10.meta'])
+        os.symlink(os.path.join(self.base_dir, 'vanished'),
+                   os.path.join(self.src_dir, 'model.ckpt-10.data-00000-of-00001'))
+        self.write_state(self.src_dir, 'model.ckpt-10', ['model.ckpt-10'])
+
+        self.worker.copyfiles(self.src_dir, self.dest_dir)
+
+        self.assertNotIn('checkpoint', os.listdir(self.dest_dir))
+
+    def test_unreadable_source_keeps_destination(self):
+        files = self.ckpt_files('model.ckpt-5') + ['checkpoint']
+        self.make_files(self.dest_dir, files)
+
+        self.worker.copyfiles(os.path.join(self.base_dir, 'missing'), self.dest_dir)
+
+        self.assertEqual(sorted(os.listdir(self.dest_dir)), sorted(files))
+
+unittest.main(verbosity=2)
@@ -3,15 +3,24 @@ The worker class. The workers only execute the commands from the master.
 '''
 
 from __future__ import print_function
+import logging
 import math
+import os
+import shutil
 import subprocess
 import time
 
-from constants import WorkerInstruction
+from mpi4py import MPI
+import numpy as np
+
+from constants import WorkerInstruction, TRAIN_RESULT_TAG
+
+logger = logging.getLogger(__name__)
 
 class TrainingWorker:
     def __init__(self, comm, master_rank, target_model_class):
         self.worker_graphs = []
+        self.graphs_by_id = {}
         self.is_expolore_only = False
         self.rank = comm.Get_rank()
         self.comm = comm
@@ -20,42 +29,56 @@ class TrainingWorker:
 
         self.train_time = 0
         self.explore_time = 0
+        self.opcode = np.zeros(1, dtype=np.int32)
 
     def main_loop(self):
         while True:
-            data = self.comm.recv(source=self.master_rank)
-            inst = data[0]
+            # The master broadcasts every opcode, followed by the arguments
+            # of ADD_GRAPHS and TRAIN. Per-worker payloads follow as a scatter
+            # and replies go back through a gather.
+            self.comm.Bcast(self.opcode, root=self.master_rank)
+            inst = WorkerInstruction(int(self.opcode[0]))
             if inst == WorkerInstruction.ADD_GRAPHS:
-                hparam_list = data[1]
-                cluster_id_begin = data[2]
-                self.is_expolore_only = data[3]
+                self.is_expolore_only, = self.comm.bcast(None, root=self.master_rank)
+                hparam_list, cluster_id_begin = self.comm.scatter(None, root=self.master_rank)
                 self.add_graphs(hparam_list, cluster_id_begin)
             elif inst == WorkerInstruction.TRAIN:
-                num_steps = data[1]
-                total_epochs = data[2]
+                num_steps, total_epochs, send_values = self.comm.bcast(None, root=self.master_rank)
                 self.train(num_steps, total_epochs)
+                if send_values:
+                    self.comm.send(self.get_all_values(), dest=self.master_rank, tag=TRAIN_RESULT_TAG)
             elif inst == WorkerInstruction.GET:
-                self.comm.send(self.get_all_values(), dest=self.master_rank)
+                self.comm.gather(self.get_all_values(), root=self.master_rank)
             elif inst == WorkerInstruction.SET:
-                vars_to_set = data[1]
-                self.set_values(vars_to_set)
+                graphs_to_set = self.comm.scatter(None, root=self.master_rank)
+                for source_id, values in graphs_to_set:
+                    self.copyfiles('./savedata/model_' + str(source_id),
+                                   './savedata/model_' + str(values[0]))
+                    logger.debug('[%d]Copied: %d -> %d', self.rank, source_id, values[0])
+                # A source graph must not train again before every worker has
+                # finished copying its checkpoint.
+                self.comm.Barrier()
+                self.set_values([values for _, values in graphs_to_set])
             elif inst == WorkerInstruction.EXPLORE:
                 self.explore_necessary_graphs()
             elif inst == WorkerInstruction.GET_PROFILING_INFO:
-                self.comm.send([self.train_time, self.explore_time], dest=self.master_rank)
+                self.comm.gather([self.train_time, self.explore_time], root=self.master_rank)
+            elif inst == WorkerInstruction.SYNC:
+                self.comm.reduce(len(self.worker_graphs), op=MPI.SUM, root=self.master_rank)
             elif inst == WorkerInstruction.EXIT:
                 break
             else:
-                print('Invalid instruction!!!!')
+                logger.error('[%d]Invalid instruction!!!!', self.rank)
 
     def add_graphs(self, hparam_list, id_begin):
         cluster_id_end = id_begin + len(hparam_list)
-        print('[{}]Got {} hparams'.format(self.rank, len(hparam_list)))
+        logger.info('[%d]Got %d hparams', self.rank, len(hparam_list))
 
         for i in range(id_begin, cluster_id_end):
             hparam = hparam_list[i - id_begin]
             new_graph = self.target_model_class(i, hparam, './savedata/model_')
             self.worker_graphs.append(new_graph)
+            self.graphs_by_id[i] = new_graph
 
     def train(self, num_epoches, total_epochs):
         train_begin_time = time.time()
@@ -66,18 +89,19 @@ class TrainingWorker:
             #print('Model {} epoch = {},  acc = {}'.format(g.cluster_id, g.epoches_trained, g.get_accuracy()))
             try:
                 g.train(num_epoches, total_epochs)
-                print('Model {} epoch = {},  acc = {}'.format(g.cluster_id, g.epoches_trained, g.get_accuracy()))
+                logger.debug('Model %d epoch = %s,  acc = %s', g.cluster_id, g.epoches_trained, g.get_accuracy())
                 if math.isnan(g.get_accuracy()) == True:
                     graphs_to_remove.append(g)
                     subprocess.call(['rm', '-rf', 'savedata/model_' + str(g.cluster_id)])
-                    print('Error occured , graph {} removed'.format(g.cluster_id))
+                    logger.warning('Error occured , graph %d removed', g.cluster_id)
             except:
                 graphs_to_remove.append(g)
                 subprocess.call(['rm', '-rf', 'savedata/model_' + str(g.cluster_id)])
-                print('Error occured , graph {} removed'.format(g.cluster_id))
+                logger.warning('Error occured , graph %d removed', g.cluster_id)
 
         for i in graphs_to_remove:
             self.worker_graphs.remove(i)
+            del self.graphs_by_id[i.cluster_id]
 
         self.train_time += time.time() - train_begin_time
 
@@ -89,16 +113,82 @@ class TrainingWorker:
 
     def set_values(self, values_to_set):
         for v in values_to_set:
-            for g in self.worker_graphs:
-                if g.cluster_id == v[0]:
-                    g.set_values(v)
-                    g.need_explore = True
+            g = self.graphs_by_id.get(v[0])
+            if g is not None:
+                g.set_values(v)
+                g.need_explore = True
+
+    def copyfiles(self, src_dir, dest_dir):
+        # Every file operation is best effort and only logs its failure: a
+        # worker that raised here would never reach the barrier after the
+        # copies, and the master and all other workers would hang in it.
+        if src_dir == dest_dir:
+            logger.warning('[%d]src_dir and dest_dir are the same: %s', self.rank, src_dir)
+            return
+        # Only the latest checkpoint is restored by the next TRAIN, so the
+        # older ones the saver keeps around are not copied. The source is read
+        # before anything is removed, so an unreadable source leaves the
+        # destination checkpoint as it was.
+        latest = self.latest_checkpoint_name(src_dir)
+        try:
+            src_files = os.listdir(src_dir)
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir)
+            dest_files = os.listdir(dest_dir)
+        except OSError as e:
+            logger.warning('[%d]Could not copy %s to %s: %s', self.rank, src_dir, dest_dir, e)
+            return
+        for i in dest_files:
+            path = os.path.join(dest_dir, i)
+            if not os.path.isdir(path) and i != 'learning_curve.csv' and i != 'theta.csv' and not i.startswith('events.out') and not i.startswith('.nfs'):
+                #print('Removing: {}'.format(path))
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning('[%d]Could not remove %s: %s', self.rank, path, e)
+        all_copied = True
+        for i in src_files:
+            path = os.path.join(src_dir, i)
+            if latest is not None and (i == 'checkpoint' or ('.ckpt' in i and not i.startswith(latest + '.'))):
+                continue
+            if not os.path.isdir(path)  and i != 'theta.csv' and i != 'learning_curve.csv' and not i.startswith('events.out') and not i.startswith('.nfs'):
+                #print('Copying: {}'.format(path))
+                try:
+                    shutil.copy(path, dest_dir)
+                except OSError as e:
+                    logger.warning('[%d]Could not copy %s: %s', self.rank, path, e)
+                    all_copied = False
+        # Without a state file the next TRAIN starts the graph from scratch
+        # instead of failing to restore an incomplete checkpoint, which would
+        # drop the graph from the population.
+        if latest is not None and not all_copied:
+            logger.warning('[%d]Incomplete copy of %s, %s will restart from scratch', self.rank, src_dir, dest_dir)
+        elif latest is not None:
+            state_path = os.path.join(dest_dir, 'checkpoint')
+            try:
+                with open(state_path, 'w') as state_file:
+                    state_file.write('model_checkpoint_path: "{0}"\nall_model_checkpoint_paths: "{0}"\n'.format(latest))
+            except OSError as e:
+                logger.warning('[%d]Could not write %s: %s', self.rank, state_path, e)
+
+    def latest_checkpoint_name(self, ckpt_dir):
+        # Reads the file name of the newest checkpoint from the state file the
+        # TF saver keeps next to the checkpoints, or None without one.
+        state_path = os.path.join(ckpt_dir, 'checkpoint')
+        try:
+            with open(state_path) as state_file:
+                for line in state_file:
+                    if line.startswith('model_checkpoint_path:'):
+                        return os.path.basename(line.split(':', 1)[1].strip().strip('"'))
+        except (IOError, OSError):
+            pass
+        return None
 
     def explore_necessary_graphs(self):
         explore_begin_time = time.time()
         for g in self.worker_graphs:
             if g.need_explore or self.is_expolore_only:
-                print('[{}]Exploring graph {}'.format(self.rank, g.cluster_id))
+                logger.debug('[%d]Exploring graph %d', self.rank, g.cluster_id)
                 g.perturb_hparams()
                 g.need_explore = False
 